@@ -1,7 +1,12 @@
+import argparse
 import base64
 import hashlib
 import requests
 import json
+import math
+import statistics
+import sys
+import time
 
 class Airfryer:
     """Airfryer Philips 5000 XXL"""
@@ -238,3 +243,162 @@ class Airfryer:
 
 # Please give your airfryer a static IP address.
 # af = Airfryer('192.168.XXX.YYY', 'XXXXXXXXXXXXXXXXXXXXXX==', 'XXXXXXXXXXXXXXXXXXXXXX==')
+
+
+def _positive_float(value: str) -> float:
+    """argparse type for values that have to be greater than 0."""
+    try:
+        number = float(value)
+    except ValueError:
+        raise argparse.ArgumentTypeError(f'{value!r} is not a number')
+    if not number > 0:
+        raise argparse.ArgumentTypeError(f'{value!r} has to be greater than 0')
+    return number
+
+def _non_negative_int(value: str) -> int:
+    """argparse type for whole numbers that can not be negative."""
+    try:
+        number = int(value)
+    except ValueError:
+        raise argparse.ArgumentTypeError(f'{value!r} is not a whole number')
+    if number < 0:
+        raise argparse.ArgumentTypeError(f'{value!r} can not be negative')
+    return number
+
+def _timed_status(af: Airfryer) -> tuple:
+    """Call get_status and measure how long it took.
+    Returns:
+        tuple: (status, latency in seconds)
+    """
+    start = time.perf_counter()
+    status = af.get_status()
+    return status, time.perf_counter() - start
+
+def _latency_stats(latencies: list) -> str:
+    """Format latency statistics (in ms) of a list of latencies (in seconds)."""
+    if not latencies:
+        return 'no successful requests'
+    ms = sorted(l * 1000 for l in latencies)
+    p95 = ms[math.ceil(len(ms) * 0.95) - 1]
+    return f'min {ms[0]:.0f}ms  avg {statistics.mean(ms):.0f}ms  p50 {statistics.median(ms):.0f}ms  p95 {p95:.0f}ms  max {ms[-1]:.0f}ms'
+
+def _watch(af: Airfryer, args: argparse.Namespace) -> None:
+    """Poll the status every interval and print it with running latency stats."""
+    latencies = []
+    errors = 0
+    record = open(args.record, 'a') if args.record else None
+    try:
+        while args.count == 0 or len(latencies) + errors < args.count:
+            status, latency = _timed_status(af)
+            if status == 0:
+                errors += 1
+                print(f'{time.strftime("%H:%M:%S")}  offline ({latency * 1000:.0f}ms)')
+            else:
+                latencies.append(latency)
+                print(f'{time.strftime("%H:%M:%S")}  {status.get("status", "")}  temp {status.get("temp", 0)}  time {status.get("cur_time", 0)}/{status.get("time", 0)}  ({latency * 1000:.0f}ms)')
+            print(f'          {_latency_stats(latencies)}  errors {errors}')
+            if record:
+                record.write(json.dumps({"ts": time.time(), "latency": latency, "status": status}) + '\n')
+                record.flush()
+            if args.count == 0 or len(latencies) + errors < args.count:
+                time.sleep(args.interval)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        if record:
+            record.close()
+
+def _load(af: Airfryer, args: argparse.Namespace) -> None:
+    """Request the status at each given rate for a while and report how the device keeps up.
+    Ctrl+C stops the run, the rate that was running is reported with what it got so far."""
+    for rate in args.rate:
+        latencies = []
+        errors = 0
+        interrupted = False
+        period = 1 / rate
+        start = time.perf_counter()
+        next_request = start
+        try:
+            while time.perf_counter() - start < args.duration:
+                status, latency = _timed_status(af)
+                if status == 0:
+                    errors += 1
+                else:
+                    latencies.append(latency)
+                next_request += period
+                delay = next_request - time.perf_counter()
+                if delay > 0:
+                    time.sleep(delay)
+        except KeyboardInterrupt:
+            interrupted = True
+        if len(latencies) + errors > 0:
+            elapsed = time.perf_counter() - start
+            achieved = (len(latencies) + errors) / elapsed
+            print(f'{rate:g} req/s: achieved {achieved:.2f} req/s  errors {errors}/{len(latencies) + errors}  {_latency_stats(latencies)}{"  (interrupted)" if interrupted else ""}')
+        if interrupted:
+            break
+
+def _dump(args: argparse.Namespace) -> None:
+    """Print a session recorded with `watch --record` and its latency stats."""
+    latencies = []
+    errors = 0
+    with open(args.file) as f:
+        for line in f:
+            if not line.strip():
+                continue
+            entry = json.loads(line)
+            status = entry['status']
+            ts = time.strftime('%Y-%m-%d %H:%M:%S', time.localtime(entry['ts']))
+            if status == 0:
+                errors += 1
+                print(f'{ts}  offline ({entry["latency"] * 1000:.0f}ms)')
+            else:
+                latencies.append(entry['latency'])
+                print(f'{ts}  {json.dumps(status, separators=(",", ":"))} ({entry["latency"] * 1000:.0f}ms)')
+    print(f'{_latency_stats(latencies)}  errors {errors}')
+
+def main(argv: list = None) -> int:
+    """Command line entry point, run with `python -m Airfryer_Loneclass`."""
+    parser = argparse.ArgumentParser(prog='python -m Airfryer_Loneclass', description='Monitor and load test a Philips airfryer.')
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    device = argparse.ArgumentParser(add_help=False)
+    device.add_argument('ip', help='IP address (or host:port of a simulator) of the airfryer')
+    device.add_argument('client_id', help='Client ID of the airfryer')
+    device.add_argument('client_secret', help='Client Secret of the airfryer')
+    device.add_argument('--command-url', default='/di/v1/products/1/airfryer', help='Command URL of the airfryer [%(default)s]')
+
+    watch = commands.add_parser('watch', parents=[device], help='Poll the status with live latency stats')
+    watch.add_argument('--interval', type=_positive_float, default=5, help='Seconds between requests [%(default)s]')
+    watch.add_argument('--count', type=_non_negative_int, default=0, help='Stop after this many requests, 0 runs until Ctrl+C [%(default)s]')
+    watch.add_argument('--record', metavar='FILE', help='Append every response to FILE (JSON lines)')
+
+    load = commands.add_parser('load', parents=[device], help='Request the status at fixed rates to find the sustainable poll rate')
+    load.add_argument('--rate', type=_positive_float, nargs='+', default=[0.5, 1, 2, 5], help='Requests per second, one run per rate [%(default)s]')
+    load.add_argument('--duration', type=_positive_float, default=30, help='Seconds per rate [%(default)s]')
+
+    dump = commands.add_parser('dump', help='Print a session recorded with watch --record')
+    dump.add_argument('file', help='Recorded session file')
+
+    args = parser.parse_args(argv)
+    if args.command == 'dump':
+        try:
+            _dump(args)
+        except (OSError, json.JSONDecodeError, KeyError) as e:
+            print(f'Could not read recorded session {args.file}: {e!r}', file=sys.stderr)
+            return 1
+        return 0
+
+    try:
+        af = Airfryer(args.ip, args.client_id, args.client_secret, args.command_url)
+    except ConnectionError as e:
+        print(e, file=sys.stderr)
+        return 1
+    if args.command == 'watch':
+        _watch(af, args)
+    else:
+        _load(af, args)
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
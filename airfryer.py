@@ -2,6 +2,7 @@ import base64
 import hashlib
 import requests
 import json
+import time
 
 config = pyscript.config.get('apps').get('airfryer')
 if config == None:
@@ -11,12 +12,23 @@ if config == None:
     client_secret      = ""
     command_url        = '/di/v1/products/1/airfryer'
     update_interval    = '86400sec'
+    reconcile_delay    = 3
 else:
     airfryer_ip        = config.get('airfryer_ip')
     client_id          = config.get('client_id')
     client_secret      = config.get('client_secret')
     command_url        = config.get('command_url', '/di/v1/products/1/airfryer')
     update_interval    = config.get('update_interval', '20sec')
+    reconcile_delay    = config.get('reconcile_delay', 3)
+
+try:
+    # Also accept the '3sec' notation used by update_interval
+    reconcile_delay = float(str(reconcile_delay).strip().lower().removesuffix('sec').removesuffix('s'))
+    if reconcile_delay < 0:
+        raise ValueError
+except ValueError:
+    log.error(f"Airfryer: Invalid reconcile_delay {reconcile_delay!r}, expected a number of seconds. Using 3.")
+    reconcile_delay = 3
 
 state.persist('pyscript.airfryer_time', 0, default_attributes={'unit_of_measurement':'S'})
 state.persist('pyscript.airfryer_time_min', 0, default_attributes={'unit_of_measurement':'Min'})
@@ -33,6 +45,15 @@ state.persist('pyscript.airfryer_step_id', '')
 state.persist('pyscript.airfryer_recipe_id', '')
 state.persist('pyscript.airfryer_shaker_reminder_active', False)
 
+session_attributes = {'started': 0, 'duration_min': 0, 'target_temp': 0, 'presets': [], 'pauses': 0, 'drawer_openings': 0, 'keep_warm_min': 0}
+state.persist('pyscript.airfryer_session', 'Idle', default_attributes=session_attributes)
+state.persist('pyscript.airfryer_last_session', 0, default_attributes={'unit_of_measurement':'Min', **session_attributes})
+state.persist('pyscript.airfryer_total_sessions', 0)
+state.persist('pyscript.airfryer_total_cook_min', 0, default_attributes={'unit_of_measurement':'Min'})
+state.persist('pyscript.airfryer_total_keep_warm_min', 0, default_attributes={'unit_of_measurement':'Min'})
+state.persist('pyscript.airfryer_total_pauses', 0)
+state.persist('pyscript.airfryer_total_drawer_openings', 0)
+
 
 class Airfryer:
     """Airfryer Philips 5000 XXL"""
@@ -272,7 +293,144 @@ class Airfryer:
         else:
             return 1
 
-def set_entities(response):
+last_response = None
+
+def _event_payload(response):
+    return {
+        'status': response.get('status', ''),
+        'prev_status': response.get('prev_status', ''),
+        'temp': response.get('temp', 0),
+        'time': response.get('time', 0),
+        'cur_time': response.get('cur_time', 0),
+        'preset': response.get('preset', 0),
+        'error': response.get('error', 0),
+        'step_id': response.get('step_id', ''),
+        'recipe_id': response.get('recipe_id', ''),
+    }
+
+def fire_transition_events(prev, response):
+    """Fire Home Assistant events for the transitions between two consecutive snapshots.
+    Args:
+        prev: Previous snapshot (dict, "offline" or None on startup).
+        response: Current snapshot (dict or "offline").
+    """
+    if prev is None or prev == response:
+        return
+    if response == "offline":
+        if isinstance(prev, dict):
+            event.fire('airfryer_offline', last_status=prev.get('status', ''))
+        return
+    if not isinstance(response, dict):
+        return
+
+    payload = _event_payload(response)
+    if prev == "offline":
+        # Nothing is known about the state before going offline, only report what is active now
+        event.fire('airfryer_online', **payload)
+        prev = {}
+    else:
+        old_status = prev.get('status', '')
+        new_status = response.get('status', '')
+        if old_status != new_status:
+            event.fire('airfryer_status_changed', from_status=old_status, to_status=new_status, **payload)
+            if old_status == 'cooking' and new_status == 'finish':
+                event.fire('airfryer_cooking_finished', **payload)
+        if bool(response.get('drawer_open', False)) and not bool(prev.get('drawer_open', False)) and old_status in ['cooking', 'pause']:
+            event.fire('airfryer_drawer_opened', **payload)
+    if response.get('shaker_reminder_active', False) and not prev.get('shaker_reminder_active', False):
+        event.fire('airfryer_shaker_reminder', **payload)
+    if response.get('error', 0) and response.get('error', 0) != prev.get('error', 0):
+        event.fire('airfryer_error', **payload)
+
+session = {k: state.getattr('pyscript.airfryer_session').get(k, v) for k, v in session_attributes.items()} if state.get('pyscript.airfryer_session') == 'Active' else None
+session_offline_grace = 300  # Seconds offline before a running session is ended
+stats_prev = None
+last_update = None
+offline_since = None
+
+def _set_session_entity(name, value, session):
+    rounded = {**session, 'duration_min': round(session['duration_min'], 1), 'keep_warm_min': round(session['keep_warm_min'], 1)}
+    state.set(name, value, {**(state.getattr(name) or {}), **rounded})
+
+def _add_minutes(name, minutes):
+    """Add minutes to a lifetime counter, the unrounded total is kept in the 'minutes' attribute."""
+    attributes = state.getattr(name) or {}
+    total = float(attributes.get('minutes', state.get(name))) + minutes
+    state.set(name, round(total, 1), {**attributes, 'minutes': total})
+
+def _end_session():
+    global session
+    pyscript.airfryer_total_sessions = int(pyscript.airfryer_total_sessions) + 1
+    _set_session_entity('pyscript.airfryer_last_session', round(session['duration_min'], 1), session)
+    _set_session_entity('pyscript.airfryer_session', 'Idle', session_attributes)
+    session = None
+
+def update_usage_stats(response):
+    """Fold a status snapshot into the current cook session and the lifetime counters.
+    Only the previous snapshot and the running totals are kept, so memory use does not grow.
+    Being offline for less than session_offline_grace seconds does not interrupt a session.
+    Args:
+        response: Current snapshot (dict or "offline").
+    """
+    global session, stats_prev, last_update, offline_since
+    now = time.time()
+    if response == "offline":
+        if offline_since is None:
+            offline_since = now
+        # What happened while offline is unknown, so after coming back only the last poll interval is counted
+        last_update = now
+        if session is not None and now - offline_since >= session_offline_grace:
+            _end_session()
+            stats_prev = None
+        return
+    offline_since = None
+
+    prev = stats_prev
+    elapsed = now - last_update if prev is not None else 0
+    stats_prev = response
+    last_update = now
+    old_status = prev.get('status', '') if prev is not None else ''
+    new_status = response.get('status', '')
+
+    if session is not None and old_status == 'cooking' and elapsed > 0:
+        if prev.get('preset', 0) == 8:
+            session['keep_warm_min'] += elapsed / 60
+            _add_minutes('pyscript.airfryer_total_keep_warm_min', elapsed / 60)
+        else:
+            session['duration_min'] += elapsed / 60
+            _add_minutes('pyscript.airfryer_total_cook_min', elapsed / 60)
+
+    if session is not None and (new_status in ['standby', 'idle'] or (new_status == 'setting' and old_status == 'finish' and response.get('preset', 0) != 8)):
+        _end_session()
+
+    if session is None and new_status == 'cooking':
+        session = {**session_attributes, 'started': now}
+    if session is None:
+        return
+
+    if new_status == 'cooking':
+        if response.get('preset', 0) not in session['presets']:
+            session['presets'] = session['presets'] + [response.get('preset', 0)]
+        if response.get('preset', 0) != 8:
+            session['target_temp'] = response.get('temp', 0)
+    if old_status == 'cooking' and new_status == 'pause':
+        session['pauses'] += 1
+        pyscript.airfryer_total_pauses = int(pyscript.airfryer_total_pauses) + 1
+    if prev is not None and bool(response.get('drawer_open', False)) and not bool(prev.get('drawer_open', False)):
+        session['drawer_openings'] += 1
+        pyscript.airfryer_total_drawer_openings = int(pyscript.airfryer_total_drawer_openings) + 1
+    _set_session_entity('pyscript.airfryer_session', 'Active', session)
+
+def set_entities(response, optimistic=False):
+    """Write a snapshot to the entities.
+    Optimistic snapshots are only shown, they do not fire events nor count in the usage statistics.
+    """
+    global last_response
+    if not optimistic and (response == "offline" or isinstance(response, dict)):
+        fire_transition_events(last_response, response)
+        update_usage_stats(response)
+        last_response = response
+
     if response == "offline":
         pyscript.airfryer_time = 0
         pyscript.airfryer_time_min = 0
@@ -305,6 +463,66 @@ def set_entities(response):
         pyscript.airfryer_recipe_id = response.get('recipe_id', '')
         pyscript.airfryer_shaker_reminder_active = response.get('shaker_reminder_active', False)
 
+def _matches(response, expected):
+    return all(response.get(key) == value for key, value in expected.items())
+
+command_seq = 0
+
+def reconcile(command, expected, args, retry, seq, delay=None):
+    """Read the real state shortly after a command and correct the entities.
+    There is only one pending reconciliation per airfryer, any newer command cancels it
+    so a retry can never undo what was asked later.
+    Args:
+        command (str): Name of the Airfryer method that was called.
+        expected (dict): The state the command should have resulted in.
+        args (tuple): Arguments the command was called with.
+        retry (bool): Send the command again if the state does not match (the command itself failed).
+        seq (int): command_seq of the command, to detect newer commands.
+        delay (float): Seconds to wait before reading. [reconcile_delay]
+    """
+    task.unique('airfryer_reconcile')
+    task.sleep(reconcile_delay if delay is None else delay)
+    if af is None or seq != command_seq:
+        return
+    response = af.get_status()
+    if seq != command_seq:
+        return
+    if response == 0:
+        set_entities("offline")
+    elif _matches(response, expected) or not retry:
+        set_entities(response)
+    else:
+        log.info("Airfryer did not take the command, retrying.")
+        result = getattr(af, command)(*args)
+        set_entities(result if not isinstance(result, int) else response)
+
+def run_command(command, expected, *args):
+    """Run an Airfryer command with an optimistic update.
+    The expected state is shown right away, if the command fails or the airfryer
+    reports something else a reconciliation read is scheduled instead of going Offline.
+    Args:
+        command (str): Name of the Airfryer method to call.
+        expected (dict): The state the command should result in.
+    Returns:
+        The response of the command.
+    """
+    global command_seq
+    command_seq += 1
+    seq = command_seq
+    if isinstance(last_response, dict):
+        set_entities({**last_response, **expected}, optimistic=True)
+    response = getattr(af, command)(*args)
+    if not isinstance(response, int):
+        set_entities(response)
+        if not _matches(response, expected):
+            task.create(reconcile, command, expected, args, False, seq)
+    elif response == 0:
+        task.create(reconcile, command, expected, args, True, seq)
+    else:
+        # The command refused based on the state it just read, show that state right away
+        task.create(reconcile, command, expected, args, False, seq, 0)
+    return response
+
 try:
     af = Airfryer(airfryer_ip, client_id, client_secret, command_url)
 except ConnectionError as e:
@@ -344,12 +562,8 @@ def airfryer_turn_on():
     """
     global af
     if af is not None:
-        response = af.turn_on()
-        if not isinstance(response, int):
-            set_entities(response)
-        elif response == 0:
-            set_entities("offline")
-        elif response == 1:
+        response = run_command('turn_on', {'status': 'setting'})
+        if response == 1:
             log.info("Airfryer is not in standby mode.")
 
 
@@ -361,14 +575,9 @@ def airfryer_turn_off():
     """
     global af
     if af is not None:
-        response = af.turn_off()
-        if not isinstance(response, int):
-            set_entities(response)
-        elif response == 0:
-            set_entities("offline")
-        elif response == 1:
+        response = run_command('turn_off', {'status': 'standby'})
+        if response == 1:
             log.info("Airfryer is already in standby mode.")
-            set_entities(response)
 
 
 @service
@@ -402,14 +611,9 @@ def airfryer_settings(temp_c, time_min):
     """
     global af
     if af is not None:
-        response = af.settings(temp_c, time_min*60)
-        if not isinstance(response, int):
-            set_entities(response)
-        elif response == 0:
-            set_entities("offline")
-        elif response == 1:
+        response = run_command('settings', {'status': 'setting', 'temp': temp_c, 'time': time_min*60, 'preset': 0}, temp_c, time_min*60)
+        if response == 1:
             log.info("Airfryer is in standby mode.")
-            set_entities(response)
 
 @service
 def airfryer_pause():
@@ -419,14 +623,9 @@ def airfryer_pause():
     """
     global af
     if af is not None:
-        response = af.pause_cooking()
-        if not isinstance(response, int):
-            set_entities(response)
-        elif response == 0:
-            set_entities("offline")
-        elif response == 1:
+        response = run_command('pause_cooking', {'status': 'pause'})
+        if response == 1:
             log.info("Airfryer is not cooking.")
-            set_entities(response)
 
 
 @service
@@ -437,23 +636,15 @@ def airfryer_start_resume():
     """
     global af
     if af is not None:
-        response = af.start_cooking()
-        if not isinstance(response, int):
-            set_entities(response)
-        elif response == 0:
-            set_entities("offline")
-        elif response == 1:
+        response = run_command('start_cooking', {'status': 'cooking'})
+        if response == 1:
             log.info("Airfryer is in standby mode.")
-            set_entities(response)
         elif response == 2:
             log.info("Airfryer is already cooking.")
-            set_entities(response)
         elif response == 3:
             log.info("Airfryer is in an unknown state.")
-            set_entities(response)
         elif response == 4:
             log.info("Airfryer drawer is open.")
-            set_entities(response)
 
 
 @service
@@ -464,14 +655,9 @@ def airfryer_stop():
     """
     global af
     if af is not None:
-        response = af.finish_cooking()
-        if not isinstance(response, int):
-            set_entities(response)
-        elif response == 0:
-            set_entities("offline")
-        elif response == 1:
+        response = run_command('finish_cooking', {'status': 'finish'})
+        if response == 1:
             log.info("Airfryer is not cooking nor paused.")
-            set_entities(response)
 
 @service
 def airfryer_keep_warm(time_min):
@@ -492,11 +678,6 @@ def airfryer_keep_warm(time_min):
     """
     global af
     if af is not None:
-        response = af.keep_warm(time_min*60)
-        if not isinstance(response, int):
-            set_entities(response)
-        elif response == 0:
-            set_entities("offline")
-        elif response == 1:
-            log.info("Airfryer is not in a suitable state.")
-            set_entities(response)
\ No newline at end of file
+        response = run_command('keep_warm', {'status': 'cooking', 'temp': 80, 'time': time_min*60, 'preset': 8}, time_min*60)
+        if response == 1:
+            log.info("Airfryer is not in a suitable state.")
\ No newline at end of file